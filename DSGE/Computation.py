@@ -1,6 +1,8 @@
 import numpy as np
 import hashlib
 
+from DSGE.Functions import Function
+
 ########################################################################
 # MODULE DESCRIPTION
 #
@@ -22,7 +24,21 @@ import hashlib
 #
 # evaluation_function_tree
 #     Recursively evaluate the functions in a function tree
-#     This function is used to implement __call__ in Variable instances
+#     This function is used by evaluate_batch
+#
+# topological_order
+#     Sort Variable instances so that each one comes after its
+#     dependencies
+#
+# evaluate_batch
+#     Evaluate all variables for one period over a batch of scenarios
+#     and simulations at once
+#
+# make_streams
+#     Create one random number generator per variable
+#
+# freeze_function_tree
+#     Convert a function tree to nested tuples so it cannot be modified
 #
 # make_variable
 #     Recursively creates the variables based on parameters
@@ -33,9 +49,11 @@ import hashlib
 #     {param_name} to generate all instances required for computations
 #
 
-def evaluate_function_tree(f_tree,kwargs):
+def evaluate_function_tree(f_tree,kwargs,rng=None,size=None):
     # Takes a function tree and dict of arguments as input and returns
     # the value of the function
+    # rng is the random number generator given to stochastic functions
+    # and size the shape of their draws
     if f_tree[0] is None:
         # If tree[0] is None, then it is either an variable argument
         # or a numeric argument
@@ -45,9 +63,99 @@ def evaluate_function_tree(f_tree,kwargs):
             return f_tree[1]  # Return value (this is int or float)
     else:
         # If tree is not none, then recursively apply to all arguments
-        args = [evaluate_function_tree(elt,kwargs) for elt in f_tree[1:]]
+        args = [evaluate_function_tree(elt,kwargs,rng,size) for elt in f_tree[1:]]
+        if isinstance(f_tree[0],Function) and f_tree[0].stochastic:
+            return f_tree[0](*args,rng=rng,size=size)
         return f_tree[0](*args)
 
+
+def topological_order(all_vars):
+    """
+    Description
+    -----------
+    Sort the Variable instances of all_vars so that each Variable comes after all its dependencies. Parameter instances are left out.
+
+    Arguments
+    ---------
+    * all_vars: dict with all Variable and Parameter instances {name: instance}
+
+    Returns
+    ------
+    A list of Variable instances
+    """
+    order = []
+    visited = set()
+
+    def visit(v):
+        if v.name in visited or not isinstance(v,Variable):
+            return
+        visited.add(v.name)
+        for dep in v.deps:
+            visit(dep)
+        order.append(v)
+
+    for v in all_vars.values():
+        visit(v)
+    return order
+
+
+def evaluate_batch(plan,values,rngs=None,size=None,shocks=None):
+    """
+    Description
+    -----------
+    Evaluate all variables for one period, each value being an array over scenarios and simulations.
+    Stochastic functions draw once with the given size, so that every scenario shares the same draws (common random numbers).
+
+    Arguments
+    ---------
+    * plan: iterable of tuples (var_name, fun_tree) sorted so that each variable comes after its dependencies
+    * values: dict {name: value} holding parameter values. It is updated in place with the values of the variables
+    * rngs: dict {var_name: random number generator} given to stochastic functions (see make_streams). If None, numpy global random state is used
+    * size: shape of the draws of stochastic functions (typically (n_simulation,))
+    * shocks: dict {name: array} of shocks added to the value of variables once computed (typically arrays of shape (n_scenario,1))
+
+    Returns
+    ------
+    values
+    """
+    shocks = shocks or {}
+    for name,tree in plan:
+        rng = None if rngs is None else rngs[name]
+        val = evaluate_function_tree(tree,values,rng,size)
+        if name in shocks:
+            val = val + shocks[name]
+        values[name] = val
+    return values
+
+
+def make_streams(names,seed):
+    """
+    Description
+    -----------
+    Creates one random number generator per variable, seeded from seed and the name of the variable.
+    Draws of a variable therefore do not depend on which other variables are evaluated.
+
+    Arguments
+    ---------
+    * names: iterable of variable names
+    * seed: int  Seed of the simulation
+
+    Returns
+    ------
+    A dict {name: numpy Generator}
+    """
+    return {
+        name: np.random.default_rng([seed,int(hashlib.md5(name.encode()).hexdigest(),16)])
+        for name in names
+        }
+
+
+def freeze_function_tree(f_tree):
+    # Recursively convert the lists of a function tree to tuples
+    if f_tree[0] is None:
+        return (None,f_tree[1])
+    return (f_tree[0],) + tuple(freeze_function_tree(elt) for elt in f_tree[1:])
+
     
 def make_variable(variables,var_name,deps,fun_tree,final_list):
     """
@@ -88,12 +196,16 @@ def make_equations(variables,eoc_variables,parameters):
     params = {}     # Sotre only parameters
     for p in parameters:
         #First create Parameter instances
-        param_object = Parameter(p,np.nan)
+        param_object = Parameter(p)
         params[p] = param_object
         all_vars[p] = param_object
     for var_name, data in eoc_variables.items():
         # Then create Variable instance
         # This is done recursively from end of chain Variable instances
+        if var_name in all_vars:
+            # Already created as a dependency of another variable
+            eoc_vars[var_name] = all_vars[var_name]
+            continue
         deps = data['dependencies']
         fun = data['function']
         tmp_var = make_variable(variables,var_name,deps,fun,all_vars)
@@ -105,17 +217,15 @@ def make_equations(variables,eoc_variables,parameters):
 class Computable:
     """
     Base class for variables and parameters. 
+    They only describe the dependency graph of the model: values are held
+    by the state of each run (see CompiledModel.run)
     """
 
     def __init__(self,name):
         self.name = name
-        self._value = np.nan
-
-    def __call__(self):
-        pass
 
     def __str__(self):
-        return '{} = {}'.format(self.name,self.value)
+        return self.name
 
     def __hash__(self):
         a = hashlib.md5(self.name.encode())
@@ -125,10 +235,6 @@ class Computable:
     def __eq__(self,other):
         return self.name == other.name
 
-    @property
-    def value(self):
-        return self._value
-        
 
 class Variable(Computable):
     """
@@ -149,25 +255,8 @@ class Variable(Computable):
         self.fun_tree = fun_tree
         self.deps = deps
 
-    def __call__(self):
-        for dep in self.deps:
-            dep()
-        kwargs = {dep.name: dep.value for dep in self.deps}
-        self._value = evaluate_function_tree(self.fun_tree,kwargs)
-        return self.value
-
 
 class Parameter(Computable):
-
-    def __init__(self,name,val=np.nan):
-        Computable.__init__(self,name)
-        self.value = val
-
-    @property
-    def value(self):
-        return self._value
-
-    @value.setter
-    def value(self,v):
-        self._value = v
-
+    """
+    Parameter are Computable which do not depend on other Computable instances
+    """
@@ -1,8 +1,12 @@
 from os.path import isfile
+from numbers import Integral
+from types import MappingProxyType
 import json
 
+import numpy as np
+
 from DSGE.Equation_parser import Econ_model_parser
-from DSGE.Computation import make_equations
+from DSGE.Computation import make_equations, make_streams, topological_order, evaluate_batch, freeze_function_tree
 
 
 ########################################################################
@@ -10,7 +14,8 @@ from DSGE.Computation import make_equations
 #
 # This module contains the main class to run economic models.
 # It defines the Econ_model class which is used to read and parse
-# parameter and variable descriptions and use them for simulation
+# parameter and variable descriptions and compile them into a
+# CompiledModel, which is used for simulation
 #
 
 ########################################################################
@@ -44,7 +49,7 @@ class Econ_model:
         self.param_path = param_path
         self.model_parameters = {}
 
-    def __call__(self,n_simulation,n_iteration):
+    def __call__(self,n_simulation,n_iteration,seed=None,targets=None):
         """
         Run the simulation
 
@@ -52,55 +57,72 @@ class Econ_model:
         ---------
         * n_simulation: int  Number of simulations
         * n_iteration: int  Number of iterations (typically number of periods)
+        * seed: int  Seed of the random number generators given to stochastic functions. If None, numpy global random state is used
+        * targets: str or iterable  Names of the variables to compute. Only these variables and their dependencies are evaluated and stored in results. If None, all variables are computed
+
+        With a seed, each variable draws from its own random number generator, so the results for targets match a full run with the same seed.
+        """
+        self.compiled_model = self.compile(targets)
+        self.results = self.compiled_model.run(None,n_simulation,n_iteration,seed)
+
+    def compile(self,targets=None):
+        """
+        Read parameters and variable descriptions and compile them
+
+        Arguments
+        ---------
+        * targets: str or iterable  Names of the variables to compute. If None, all variables are computed
+
+        Returns
+        ------
+        A CompiledModel instance, which can be run many times (including from several threads) without reloading the model
         """
         self._load_simulation_parameters()
-        self._load_equations()
-        self._assign_parameter_value()
-        for i in range(n_simulation):
-            for v,d in self.results.items():
-                d[i] = []
-            for j in range(n_iteration):
-                self._compute_variables()
-                self._store_iteration_results(i)
-            self._store_simulation_results()
-            
+        order,parameters,all_parameters = self._load_equations(targets)
+        return CompiledModel(
+            self.model_name,
+            [(v.name,v.fun_tree) for v in order],
+            {p: self.model_parameters.get(p,np.nan) for p in parameters},
+            all_parameters
+            )
+
+    def impulse_responses(self,shocks,n_simulation,n_iteration,seed=None,targets=None,baseline=False):
+        """
+        Compute impulse responses to a set of shocks
+
+        See CompiledModel.impulse_responses. targets restricts the computation as in __call__, so shocked names must belong to the dependency cone of targets
+        """
+        return self.compile(targets).impulse_responses(shocks,n_simulation,n_iteration,seed,baseline)
 
     def _load_simulation_parameters(self):
         with open(self.param_path) as f:
             self.model_parameters = json.load(f)
 
-    def _load_equations(self):
+    def _load_equations(self,targets=None):
         parser = Econ_model_parser()
         with open(self.model_path,'r') as f:
             for line in f:
                 parser.run(line)
 
-        all_vars,eoc,param = make_equations(
+        eoc_variables = parser.get_end_of_chain_variables()
+        parameters = parser.get_parameters()
+        if targets is not None:
+            # Only keep the subgraph required to compute targets
+            if isinstance(targets,str):
+                targets = [targets]
+            cone = parser.get_dependency_cone(targets)
+            eoc_variables = {t: parser.variables[t] for t in targets if t not in parameters}
+            parameters = parameters & cone
+
+        all_vars,_,param = make_equations(
             parser.variables,
-            parser.get_end_of_chain_variables(),
-            parser.get_parameters()
+            eoc_variables,
+            parameters
             )
 
-        self.parameter_objects = param
-        self.end_of_chain_variables = eoc
-        self.all_variables = all_vars
-        self.results = {name:{} for name in self.all_variables.keys()}
-        
-
-    def _assign_parameter_value(self):
-        for p,v in self.model_parameters.items():
-            self.all_variables[p].value = v
-
-    def _compute_variables(self):
-        for v in self.end_of_chain_variables.values():
-            v()
-
-    def _store_iteration_results(self,simulation):
-        for name,v in self.all_variables.items():
-            self.results[name][simulation].append(v.value)
-
-    def _store_simulation_results(self):
-        pass
+        # Return variables in evaluation order, names of parameters used
+        # and names of all parameters of the model
+        return (topological_order(all_vars),set(param),parser.get_parameters())
 
 
     @property
@@ -125,8 +147,143 @@ class Econ_model:
     
     @model_parameters.setter
     def model_parameters(self,param):
-        self._model_parameters = param    
+        self._model_parameters = param
 
-    
-        
-    
+
+class CompiledModel:
+    """
+    Compiled economic model
+
+    A CompiledModel only holds the execution plan of a model, which cannot be modified once created. All state of a simulation is allocated by run, so a single instance can be run many times, including concurrently from several threads.
+    """
+
+    __slots__ = ('_model_name','_plan','_parameters','_parameter_names','_names')
+
+    def __init__(self,model_name,plan,parameters,parameter_names=None):
+        """
+        CompiledModel instanciation
+
+        Arguments
+        ---------
+        * model_name: str name of the model
+        * plan: iterable of tuples (var_name, fun_tree) sorted so that each variable comes after its dependencies
+        * parameters: dict {param_name: value} of default parameter values
+        * parameter_names: iterable  Names of all parameters of the model, including those pruned from the plan. If None, the keys of parameters
+        """
+        # Attributes are set through object.__setattr__ as __setattr__
+        # forbids any assignment
+        plan = tuple((name,freeze_function_tree(tree)) for name,tree in plan)
+        parameters = MappingProxyType(dict(parameters))
+        object.__setattr__(self,'_model_name',model_name)
+        object.__setattr__(self,'_plan',plan)
+        object.__setattr__(self,'_parameters',parameters)
+        object.__setattr__(self,'_parameter_names',frozenset(parameters if parameter_names is None else parameter_names) | frozenset(parameters))
+        object.__setattr__(self,'_names',tuple(parameters) + tuple(name for name,_ in plan))
+
+    def __setattr__(self,name,value):
+        raise AttributeError('CompiledModel is immutable')
+
+    def __delattr__(self,name):
+        raise AttributeError('CompiledModel is immutable')
+
+    def run(self,params,n_simulation,n_iteration,seed=None):
+        """
+        Run the simulation
+
+        Arguments
+        ---------
+        * params: dict {param_name: value} overriding default parameter values. Parameters pruned from the plan are ignored, names which are not parameters of the model raise KeyError. If None, default values are used
+        * n_simulation: int  Number of simulations
+        * n_iteration: int  Number of iterations (typically number of periods)
+        * seed: int  Seed of the random number generators given to stochastic functions. If None, numpy global random state is used
+
+        Returns
+        ------
+        A dict {name: {simulation: [value at each iteration]}} for all parameters and variables
+        """
+        param_values = dict(self._parameters)
+        if params is not None:
+            for p,v in params.items():
+                if p not in self._parameter_names:
+                    raise KeyError('Unknown parameter {}'.format(p))
+                if p in param_values:
+                    param_values[p] = v
+        rngs = None if seed is None else make_streams(self.variables,seed)
+        # All simulations of an iteration are evaluated at once
+        paths = {name: [] for name in self._names}
+        for j in range(n_iteration):
+            values = evaluate_batch(self._plan,param_values.copy(),rngs,(n_simulation,))
+            for name,path in paths.items():
+                path.append(np.broadcast_to(values[name],(n_simulation,)))
+        results = {}
+        for name,path in paths.items():
+            path = np.stack(path,axis=1) if path else np.empty((n_simulation,0))
+            results[name] = {i: path[i].tolist() for i in range(n_simulation)}
+        return results
+
+    def impulse_responses(self,shocks,n_simulation,n_iteration,seed=None,baseline=False):
+        """
+        Compute impulse responses to a set of shocks
+
+        The baseline and all shocked scenarios are evaluated in a single batched run where every scenario uses the same random draws (common random numbers), so that responses are not blurred by Monte Carlo noise.
+
+        Arguments
+        ---------
+        * shocks: iterable of tuples (name, size, timing) where size is added to the value of the variable or parameter name at period timing
+        * n_simulation: int  Number of simulations
+        * n_iteration: int  Number of iterations (typically number of periods)
+        * seed: int  Seed of the random number generators given to stochastic functions. If None, numpy global random state is used
+        * baseline: bool  If True, also return the baseline
+
+        With a seed, the draws are those of run with the same seed, so the baseline matches run.
+
+        Returns
+        ------
+        A list aligned with shocks of dicts {name: array} where each array has shape (n_iteration,) and holds the mean difference between the shocked scenario and the baseline
+        If baseline is True, a tuple (baseline, responses) where baseline is a dict {name: array} holding the mean of the baseline scenario at each iteration
+        """
+        shocks = [tuple(shock) for shock in shocks]
+        for name,_,timing in shocks:
+            if name not in self._names:
+                raise KeyError('Unknown variable {}'.format(name))
+            if not isinstance(timing,Integral) or not 0 <= timing < n_iteration:
+                raise ValueError('Shock timing {} of {} is not an iteration in range({})'.format(timing,name,n_iteration))
+        rngs = None if seed is None else make_streams(self.variables,seed)
+
+        # Scenario 0 is the baseline, scenario k+1 holds shocks[k]
+        n_scenario = len(shocks) + 1
+        responses = {name: np.zeros((n_scenario,n_iteration)) for name in self._names}
+        for j in range(n_iteration):
+            period_shocks = {}
+            for k,(name,size,timing) in enumerate(shocks):
+                if timing == j:
+                    if name not in period_shocks:
+                        period_shocks[name] = np.zeros((n_scenario,1))
+                    period_shocks[name][k+1] += size
+            values = {}
+            for p,v in self._parameters.items():
+                values[p] = v + period_shocks[p] if p in period_shocks else v
+            evaluate_batch(self._plan,values,rngs,(n_simulation,),period_shocks)
+            for name,v in values.items():
+                v = np.broadcast_to(v,(n_scenario,n_simulation))
+                responses[name][:,j] = v.mean(axis=1)
+
+        shock_responses = [
+            {name: r[k+1] - r[0] for name,r in responses.items()}
+            for k in range(len(shocks))
+            ]
+        if baseline:
+            return ({name: r[0] for name,r in responses.items()},shock_responses)
+        return shock_responses
+
+    @property
+    def model_name(self):
+        return self._model_name
+
+    @property
+    def parameters(self):
+        return self._parameters
+
+    @property
+    def variables(self):
+        return tuple(name for name,_ in self._plan)
@@ -1,7 +1,7 @@
 import ply.lex as lex
 import ply.yacc as yacc
 
-from numpy.random import normal
+from DSGE.Functions import FUNCTIONS
 
 ########################################################################
 # MODULE DESCRIPTION
@@ -16,7 +16,6 @@ from numpy.random import normal
 # Add lag operator (complicated to add, but important)
 # Add a uminus rules for atom
 #       For the moment, only exists for number
-# Add new functions (e.g. exp, log) from numpy (easy to do)
 # Check why get_dependencies needs [] as a second argument
 #       If second argument is blank, it creates a single list of
 #       dependencies for all variables
@@ -33,19 +32,14 @@ from numpy.random import normal
 # CONSTANTS AND FUNCTIONS
 #
 # This module relies on two constants:
-#      FUNCTIONS: mapping of function names (str) to actual python 
-#                 functions
+#      FUNCTIONS: mapping of function names (str) to Function instances
+#                 (see DSGE.Functions)
 #      LAMBDA_BINOP: Mapping of string representation of binary
 #                    operators to lambda function
 #      get_dependencies: Retrieve dependencies of a variable from its
 #                        function tree
 #
 
-FUNCTIONS = {
-    'N': normal     #Normal law N(mu,sigma) from numpy
-    }
-
-
 LAMBDA_BINOP = {
     '+': lambda x, y : x + y,
     '-': lambda x, y : x - y,
@@ -93,11 +87,13 @@ class Parser:
     def __init__(self, **kw):
         self.variables = {}
         # Build the lexer and parser
-        lex.lex(module=self)
-        yacc.yacc(module=self)
+        # They are kept on the instance so that several parsers can
+        # coexist (yacc.parse would use the last one built)
+        self.lexer = lex.lex(module=self)
+        self.parser = yacc.yacc(module=self)
 
     def run(self,s):
-            yacc.parse(s)
+            self.parser.parse(s,lexer=self.lexer)
 
 ########################################################################
 # MAIN CLASS: Econ_model_parser
@@ -137,7 +133,7 @@ class Econ_model_parser(Parser):
     parser.run('A = N(mu,sigma)')
 
     print(parser.variables)
-    > {'Y': {'function': [<function Econ_model_parser.p_atom_binop.<locals>.<lambda> at 0x7fccb9542950>, [<function Econ_model_parser.p_atom_binop.<locals>.<lambda> at 0x7fccb95428c8>, [None, 'A'], [None, 'x']], [None, 'B']], 'dependencies': ['A', 'x', 'B']}, 'A': {'function': [<built-in method normal of mtrand.RandomState object at 0x7fccb9b435a0>, [None, 'mu'], [None, 'sigma']], 'dependencies': ['mu', 'sigma']}, 'x': None, 'B': None, 'mu': None, 'sigma': None}
+    > {'Y': {'function': [<function Econ_model_parser.p_atom_binop.<locals>.<lambda> at 0x7fccb9542950>, [<function Econ_model_parser.p_atom_binop.<locals>.<lambda> at 0x7fccb95428c8>, [None, 'A'], [None, 'x']], [None, 'B']], 'dependencies': ['A', 'x', 'B']}, 'A': {'function': [Function(N), [None, 'mu'], [None, 'sigma']], 'dependencies': ['mu', 'sigma']}, 'x': None, 'B': None, 'mu': None, 'sigma': None}
 
     print(parser.end_of_chain_variables)
     {'Y'}
@@ -150,12 +146,38 @@ class Econ_model_parser(Parser):
     variables = {}
     end_of_chain_variables = set()
 
+    def __init__(self, **kw):
+        # Instance level set, the class level one would be shared by
+        # all parsers
+        self.end_of_chain_variables = set()
+        Parser.__init__(self, **kw)
+
     def get_parameters(self):
         return {p for p,f in self.variables.items() if f is None}
 
     def get_end_of_chain_variables(self):
         return {v: self.variables[v] for v in self.end_of_chain_variables}
 
+    def get_dependency_cone(self,targets):
+        """
+        Returns the set of names of targets and all variables and parameters they depend on, directly or not
+        targets is either a single name or an iterable of names
+        """
+        if isinstance(targets,str):
+            targets = [targets]
+        cone = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name in cone:
+                continue
+            if name not in self.variables:
+                raise KeyError('Unknown variable {}'.format(name))
+            cone.add(name)
+            if self.variables[name] is not None:
+                stack.extend(self.variables[name]['dependencies'])
+        return cone
+
 ########################################################################
 # TOKENS DEFINITION
 #
@@ -281,7 +303,13 @@ class Econ_model_parser(Parser):
     def p_function(self, p):
         'function : NAME parameters'
         fun = FUNCTIONS[p[1]]
-        p[0] = [fun] + p[2]
+        if len(p[2]) != fun.arity:
+            raise ValueError('{} expects {} arguments, got {}'.format(p[1],fun.arity,len(p[2])))
+        if fun.pure and all(type(arg[1]) is not str for arg in p[2]):
+            # Constant-fold pure functions called on numbers only
+            p[0] = [None, fun(*[arg[1] for arg in p[2]])]
+        else:
+            p[0] = [fun] + p[2]
 
     def p_number(self, p):
         """number : INTEGER 
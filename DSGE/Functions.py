@@ -0,0 +1,179 @@
+import numpy as np
+
+########################################################################
+# MODULE DESCRIPTION
+#
+# This module contains the registry of functions which can be used in
+# variable definitions (e.g. 'A = N(mu,sigma)' or 'y = exp(x)').
+#
+# Each function is stored as a Function instance which declares:
+#     - its vectorized implementation (NumPy ufunc or batched function)
+#     - its arity
+#     - whether it is pure or stochastic
+#     - its partial derivatives, where they exist
+#
+# Engines can use this metadata to batch calls, constant-fold pure
+# calls and give stochastic calls a proper random number generator
+#
+
+########################################################################
+# TO DO LIST
+#
+# Add derivatives for stochastic functions with respect to their
+#       deterministic arguments (e.g. AR1 with respect to x)
+# Make AR1 use the lagged value of the variable it defines once the
+#       parser has a lag operator
+#
+
+########################################################################
+# CONSTANTS AND FUNCTIONS
+#
+# This module relies on one constant:
+#      FUNCTIONS: mapping of function names (str) to Function instances
+#
+#      register_function: Create a Function instance and add it to
+#                         FUNCTIONS
+#
+
+
+class Function:
+    """
+    Description
+    -----------
+    Function which can be called in a variable definition.
+
+    Pure functions are called with their arguments only. Stochastic functions are implemented as fun(rng, *args, size=None) where rng is a numpy Generator (or the numpy.random module, which shares the same interface) used to draw random numbers and size is the shape of the draws.
+
+    Arguments
+    ---------
+    * name: str  Name of the function in variable definitions
+    * fun: callable  Vectorized implementation of the function
+    * arity: int  Number of arguments of the function
+    * stochastic: bool  True if the function draws random numbers
+    * derivative: tuple  Partial derivatives of the function (one callable per argument, with the same arguments as fun), or None
+
+    Example
+    -------
+    f = FUNCTIONS['exp']
+    f(0.)
+    > 1.0
+
+    g = FUNCTIONS['N']
+    g(0.,1.,rng=numpy.random.default_rng(0),size=3)
+    > array([ 0.12573022, -0.13210486,  0.64042265])
+    """
+
+    def __init__(self,name,fun,arity,stochastic=False,derivative=None):
+        if derivative is not None and len(derivative) != arity:
+            raise ValueError('{} expects {} partial derivatives, got {}'.format(name,arity,len(derivative)))
+        self.name = name
+        self.fun = fun
+        self.arity = arity
+        self.stochastic = stochastic
+        self.derivative = derivative
+
+    def __call__(self,*args,rng=None,size=None):
+        if self.stochastic:
+            if rng is None:
+                # Fall back on numpy global random state
+                rng = np.random
+            return self.fun(rng,*args,size=size)
+        return self.fun(*args)
+
+    def __repr__(self):
+        return 'Function({})'.format(self.name)
+
+    @property
+    def pure(self):
+        return not self.stochastic
+
+    def differentiate(self,*args):
+        """
+        Returns the tuple of partial derivatives evaluated at args
+        """
+        if self.derivative is None:
+            raise ValueError('{} has no derivative'.format(self.name))
+        return tuple(d(*args) for d in self.derivative)
+
+
+FUNCTIONS = {}
+
+
+def register_function(name,fun,arity,stochastic=False,derivative=None):
+    """
+    Description
+    -----------
+    Creates a Function instance and adds it to FUNCTIONS so it can be used in variable definitions.
+    Registering a name twice replaces the previous function.
+
+    Arguments
+    ---------
+    See Function
+
+    Returns
+    ------
+    The Function instance
+    """
+    f = Function(name,fun,arity,stochastic,derivative)
+    FUNCTIONS[name] = f
+    return f
+
+
+########################################################################
+# STANDARD FUNCTIONS
+#
+
+# Pure functions
+register_function('exp', np.exp, 1, derivative=(np.exp,))
+register_function('log', np.log, 1, derivative=(lambda x: 1 / x,))
+register_function('sqrt', np.sqrt, 1, derivative=(lambda x: 0.5 / np.sqrt(x),))
+register_function('max', np.maximum, 2, derivative=(
+    lambda x, y: np.where(x >= y, 1., 0.),
+    lambda x, y: np.where(x >= y, 0., 1.)
+    ))
+register_function('min', np.minimum, 2, derivative=(
+    lambda x, y: np.where(x <= y, 1., 0.),
+    lambda x, y: np.where(x <= y, 0., 1.)
+    ))
+
+# Stochastic functions
+# They are written as transforms of standard draws of the given size so
+# that arguments varying across batched scenarios broadcast against the
+# same draws (common random numbers)
+
+def check_scale(name,sigma):
+    # Transforms of standard draws do not validate their arguments as
+    # numpy samplers do
+    if np.any(np.asarray(sigma) < 0):
+        raise ValueError('{}: sigma < 0'.format(name))
+
+
+def normal(rng,mu,sigma,size=None):
+    check_scale('N',sigma)
+    return mu + sigma * rng.standard_normal(size)
+
+
+def lognormal(rng,mu,sigma,size=None):
+    check_scale('lognormal',sigma)
+    return np.exp(mu + sigma * rng.standard_normal(size))
+
+
+def uniform(rng,low,high,size=None):
+    if np.any(np.asarray(high) < np.asarray(low)):
+        raise ValueError('uniform: high < low')
+    return low + (high - low) * rng.random(size)
+
+
+def ar1_step(rng,x,rho,sigma,size=None):
+    # One step of an AR(1) process: rho * x + sigma * eps with eps
+    # following N(0,1). x must be the previous value of the process.
+    # As the parser has no lag operator yet, x can only be another
+    # variable or a parameter, e.g. 'e = AR1(e_lag, rho, sigma)'
+    check_scale('AR1',sigma)
+    return rho * x + sigma * rng.standard_normal(size)
+
+
+register_function('N', normal, 2, stochastic=True)  #Normal law N(mu,sigma)
+register_function('lognormal', lognormal, 2, stochastic=True)
+register_function('uniform', uniform, 2, stochastic=True)
+register_function('AR1', ar1_step, 3, stochastic=True)
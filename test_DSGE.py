@@ -0,0 +1,191 @@
+"""
+Regression tests for the DSGE package
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from DSGE.Econ_model import Econ_model
+from DSGE.Equation_parser import Econ_model_parser
+from DSGE.Functions import FUNCTIONS
+
+
+@pytest.fixture
+def stochastic_model(tmp_path):
+    model_path = tmp_path / 'model'
+    param_path = tmp_path / 'params'
+    model_path.write_text(
+        'Y = exp(x) + N(0, s)\n'
+        'Z = max(Y, 1) * N(1, s)\n'
+        'Q = AR1(x, 0.5, s)\n'
+        'F = lognormal(0, s) + Q'
+        )
+    param_path.write_text(json.dumps({'x': 0.5, 's': 1.0}))
+    return Econ_model('test', str(model_path), str(param_path))
+
+
+def test_arity_is_checked_at_parse_time():
+    parser = Econ_model_parser()
+    with pytest.raises(ValueError):
+        parser.run('Y = exp(x, z)')
+
+
+def test_pure_function_on_numbers_is_constant_folded():
+    parser = Econ_model_parser()
+    parser.run('Y = exp(1)')
+    tree = parser.variables['Y']['function']
+    assert tree[0] is None
+    assert tree[1] == pytest.approx(2.718281828459045)
+
+
+@pytest.mark.parametrize('name,args', [
+    ('exp', (0.7,)),
+    ('log', (0.7,)),
+    ('sqrt', (0.7,)),
+    ('max', (0.7, 1.3)),
+    ('max', (1.3, 0.7)),
+    ('min', (0.7, 1.3)),
+    ('min', (1.3, 0.7)),
+    ])
+def test_derivatives_match_finite_differences(name, args):
+    f = FUNCTIONS[name]
+    h = 1e-6
+    for i, partial in enumerate(f.differentiate(*args)):
+        up = list(args)
+        down = list(args)
+        up[i] += h
+        down[i] -= h
+        assert partial == pytest.approx((f(*up) - f(*down)) / (2 * h), rel=1e-6, abs=1e-9)
+
+
+def test_max_min_derivatives_break_ties_on_first_argument():
+    assert FUNCTIONS['max'].differentiate(1., 1.) == (1., 0.)
+    assert FUNCTIONS['min'].differentiate(1., 1.) == (1., 0.)
+
+
+@pytest.mark.parametrize('name,args', [
+    ('N', (0., 1.)),
+    ('lognormal', (0., 1.)),
+    ('uniform', (0., 1.)),
+    ('AR1', (1., 0.5, 1.)),
+    ])
+def test_stochastic_functions_use_rng_and_size(name, args):
+    f = FUNCTIONS[name]
+    a = f(*args, rng=np.random.default_rng(0), size=(3, 2))
+    b = f(*args, rng=np.random.default_rng(0), size=(3, 2))
+    assert a.shape == (3, 2)
+    assert np.array_equal(a, b)
+
+
+@pytest.mark.parametrize('name,args', [
+    ('N', (0., -1.)),
+    ('lognormal', (0., -1.)),
+    ('AR1', (1., 0.5, -1.)),
+    ('uniform', (1., 0.)),
+    ])
+def test_stochastic_functions_reject_invalid_scale(name, args):
+    with pytest.raises(ValueError):
+        FUNCTIONS[name](*args, size=2)
+
+
+def test_targets_match_full_run(stochastic_model):
+    full = stochastic_model.compile()
+    pruned = stochastic_model.compile(['F'])
+    assert set(pruned.variables) == {'Q', 'F'}
+    assert pruned.run(None, 5, 4, seed=7)['F'] == full.run(None, 5, 4, seed=7)['F']
+
+
+def test_single_name_target(stochastic_model):
+    assert set(stochastic_model.compile('F').variables) == {'Q', 'F'}
+
+
+def test_compiled_model_is_shared_across_threads(stochastic_model):
+    compiled = stochastic_model.compile()
+    expected = compiled.run(None, 20, 5, seed=3)
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: compiled.run(None, 20, 5, seed=3), range(32)))
+    assert all(r == expected for r in results)
+
+
+@pytest.fixture
+def linear_model(tmp_path):
+    model_path = tmp_path / 'linear_model'
+    param_path = tmp_path / 'linear_params'
+    model_path.write_text(
+        'Y = exp(x) + N(0, s)\n'
+        'W = 2 * Y'
+        )
+    param_path.write_text(json.dumps({'x': 0.5, 's': 1.0}))
+    return Econ_model('linear', str(model_path), str(param_path))
+
+
+@pytest.mark.parametrize('seed', [None, 0, 1])
+def test_impulse_responses_share_draws(linear_model, seed):
+    response, = linear_model.impulse_responses([('Y', 1.0, 1)], 50, 3, seed=seed)
+    assert response['W'] == pytest.approx([0., 2., 0.], abs=1e-12)
+
+
+def test_impulse_responses_to_parameter_shock(linear_model):
+    response, = linear_model.impulse_responses([('x', 1.0, 0)], 50, 2, seed=0)
+    assert response['Y'] == pytest.approx([np.exp(1.5) - np.exp(0.5), 0.], abs=1e-12)
+
+
+def test_impulse_responses_are_aligned_with_shocks(linear_model):
+    responses = linear_model.impulse_responses([['Y', 1.0, 0], ['Y', 1.0, 0], ('Y', 3.0, 1)], 10, 2, seed=0)
+    assert len(responses) == 3
+    assert responses[0]['W'] == pytest.approx([2., 0.], abs=1e-12)
+    assert responses[1]['W'] == pytest.approx([2., 0.], abs=1e-12)
+    assert responses[2]['W'] == pytest.approx([0., 6.], abs=1e-12)
+
+
+def test_impulse_responses_baseline_matches_run(linear_model):
+    compiled = linear_model.compile()
+    baseline, _ = compiled.impulse_responses([('Y', 1.0, 0)], 20, 3, seed=5, baseline=True)
+    results = compiled.run(None, 20, 3, seed=5)
+    for name in ('Y', 'W'):
+        paths = np.array([results[name][i] for i in range(20)])
+        assert baseline[name] == pytest.approx(paths.mean(axis=0), abs=1e-12)
+
+
+@pytest.mark.parametrize('shock,error', [
+    (('Y', 1.0, 2), ValueError),
+    (('Y', 1.0, -1), ValueError),
+    (('Y', 1.0, 0.5), ValueError),
+    (('unknown', 1.0, 0), KeyError),
+    ])
+def test_impulse_responses_reject_invalid_shocks(linear_model, shock, error):
+    with pytest.raises(error):
+        linear_model.impulse_responses([shock], 10, 2)
+
+
+def test_compiled_model_is_immutable(stochastic_model):
+    compiled = stochastic_model.compile()
+    with pytest.raises(AttributeError):
+        compiled._plan = ()
+    with pytest.raises(AttributeError):
+        compiled.state = {}
+    with pytest.raises(AttributeError):
+        del compiled._parameters
+    with pytest.raises(TypeError):
+        compiled.parameters['x'] = 0.
+
+
+def test_impulse_responses_keep_results(stochastic_model):
+    stochastic_model(2, 2, seed=1)
+    stochastic_model.impulse_responses([('Y', 1.0, 0)], 10, 2, seed=1)
+    assert len(stochastic_model.results['F']) == 2
+
+
+def test_run_rejects_unknown_parameters(tmp_path):
+    model_path = tmp_path / 'model'
+    param_path = tmp_path / 'params'
+    model_path.write_text('Y = a + N(0, s)\nZ = 2 * b')
+    param_path.write_text(json.dumps({'a': 1.0, 'b': 1.0, 's': 1.0}))
+    pruned = Econ_model('test', str(model_path), str(param_path)).compile('Y')
+    assert pruned.run({'a': 3.0, 's': 0.}, 1, 1)['Y'] == {0: [3.0]}
+    # b is a parameter of the model even though Z is pruned away
+    pruned.run({'b': 2.0}, 1, 1)
+    with pytest.raises(KeyError):
+        pruned.run({'alpah': 0.5}, 1, 1)